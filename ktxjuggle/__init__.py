@@ -1,7 +1,10 @@
 __version__ = '0.4.0'
 
 # Public API
+from ktxjuggle.archive import convertArchive
+from ktxjuggle.cache import Cache
 from ktxjuggle.ktx import Ktx
+from ktxjuggle.metadata import readMetadata, editMetadata
 
 # Defer logging
 import logging
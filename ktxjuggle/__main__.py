@@ -4,6 +4,13 @@ If the output argument is omitted, then JSON
 is printed to stdout and no files are written.
 If the output file is JSON, then the pixel data
 is written to separate binary files.
+If the output file is .jsonl, then compact JSON Lines
+are written, which are faster to read and write.
+If the input is a tar archive (or - for stdin), then each
+.ktx entry is converted to .json and each .json(l) entry to .ktx,
+and written to the output tar archive (or - for stdout).
+Metadata edits only rewrite the header of a KTX file,
+in place if the output argument is omitted.
 """
 
 import argparse
@@ -12,6 +19,8 @@ import pathlib
 import sys
 
 import ktxjuggle
+from ktxjuggle import archive
+from ktxjuggle import binary
 
 
 logger = logging.getLogger(__name__)
@@ -39,11 +48,53 @@ def main():
 		metavar='INT',
 		default=16,
 		help='max length of inlined image pattern (default: 16)')
+	parser.add_argument(
+		'--workers',
+		type=int,
+		metavar='INT',
+		default=4,
+		help='number of threads to process images (default: 4)')
 	parser.add_argument(
 		'--noalign',
 		action='store_true',
 		default=False,
 		help='do not align metadata and images')
+	parser.add_argument(
+		'--jsonl',
+		action='store_true',
+		default=False,
+		help='convert tar archive entries to .jsonl instead of .json')
+	parser.add_argument(
+		'--set',
+		type=str,
+		metavar='KEY=VALUE',
+		action='append',
+		default=[],
+		help='set percent-encoded metadata value of KTX file')
+	parser.add_argument(
+		'--delete',
+		type=str,
+		metavar='KEY',
+		action='append',
+		default=[],
+		help='delete percent-encoded metadata key of KTX file')
+	parser.add_argument(
+		'--list',
+		action='store_true',
+		default=False,
+		help='print metadata of KTX file as KEY=VALUE')
+	parser.add_argument(
+		'--cache',
+		type=str,
+		metavar='DIR',
+		default='',
+		help='cache converted files in this directory')
+	parser.add_argument(
+		'--cache-size',
+		type=int,
+		metavar='MB',
+		default=1024,
+		help='max size of cache directory in megabytes (default: 1024)')
 	parser.add_argument('IN', help='input file name')
 	parser.add_argument('OUT', nargs='?', default='', help='output file name')
 	args = parser.parse_args()
@@ -52,20 +103,32 @@ def main():
 		logging.basicConfig(format='%(levelname)s: %(message)s', level=args.log)
 
 	try:
+		if args.set or args.delete or args.list:
+			if args.cache:
+				raise ValueError('--cache cannot be combined with metadata edits')
+			editMetadata(args)
+			return
+		if archive.isArchive(args.IN):
+			if args.cache:
+				raise ValueError('--cache cannot be combined with tar archives')
+			convertArchive(args)
+			return
+
+		if args.cache:
+			cache = ktxjuggle.Cache(args.cache, args.cache_size << 20)
+			jsonText = cache.convertFile(
+				args.IN, args.OUT or None, args.inline, not args.noalign, args.workers)
+			if jsonText is not None:
+				sys.stdout.write(jsonText)
+			return
+
 		# Input
 		inPath = pathlib.Path(args.IN)
-		if inPath.suffix == '.ktx':
-			with open(inPath, mode='rb') as inStream:
-				ktx = ktxjuggle.Ktx.fromBinary(inStream, not args.noalign)
-		elif inPath.suffix == '.json':
-			with open(inPath, mode='r') as inStream:
-				ktx = ktxjuggle.Ktx.fromJson(inStream, inPath.parent)
-		else:
-			raise ValueError('Input file must be .ktx or .json')
+		ktx = ktxjuggle.Ktx.fromFile(inPath, not args.noalign, args.workers)
 
 		# Output
 		if not args.OUT:
-			ktx.toJson(sys.stdout, None, inPath.stem, args.inline)
+			ktx.toJson(sys.stdout, None, inPath.stem, args.inline, args.workers)
 		else:
 			outPath = pathlib.Path(args.OUT)
 			outPath.parent.mkdir(parents=True, exist_ok=True)
@@ -74,13 +137,62 @@ def main():
 					ktx.toBinary(outStream, not args.noalign)
 			elif outPath.suffix == '.json':
 				with open(outPath, mode='w') as outStream:
-					ktx.toJson(outStream, outPath.parent, outPath.stem, args.inline)
+					ktx.toJson(outStream, outPath.parent, outPath.stem, args.inline, args.workers)
+			elif outPath.suffix == '.jsonl':
+				with open(outPath, mode='w') as outStream:
+					ktx.toJsonLines(outStream, outPath.parent, outPath.stem, args.inline, args.workers)
 			else:
-				raise ValueError('Output file must be .ktx or .json')
+				raise ValueError('Output file must be .ktx, .json, or .jsonl')
 	except Exception as e:
 		logger.error(e)
 		raise SystemExit(1)
 
 
+def convertArchive(args):
+	if not archive.isArchive(args.OUT):
+		raise ValueError('Output must be a tar archive or - for stdout')
+
+	if args.IN == '-':
+		inStream = sys.stdin.buffer
+	else:
+		inStream = open(args.IN, mode='rb')
+	if args.OUT == '-':
+		outStream = sys.stdout.buffer
+	else:
+		outPath = pathlib.Path(args.OUT)
+		outPath.parent.mkdir(parents=True, exist_ok=True)
+		outStream = open(outPath, mode='wb')
+
+	with inStream, outStream:
+		failures = ktxjuggle.convertArchive(
+			inStream, outStream, archive.writeMode(args.OUT), args.inline, not args.noalign,
+			args.jsonl)
+	if failures:
+		raise ValueError(f'Failed to convert {failures} archive entries')
+
+
+def editMetadata(args):
+	inPath = pathlib.Path(args.IN)
+	outPath = pathlib.Path(args.OUT) if args.OUT else inPath
+	if inPath.suffix != '.ktx' or outPath.suffix != '.ktx':
+		raise ValueError('Metadata can only be edited in .ktx files')
+
+	if args.set or args.delete or outPath != inPath:
+		setPairs = []
+		for pair in args.set:
+			if '=' not in pair:
+				raise ValueError('Metadata must be set as KEY=VALUE: ' + pair)
+			key, value = pair.split('=', maxsplit=1)
+			setPairs.append((binary.pctDecode(key), binary.pctDecode(value)))
+		deleteKeys = [binary.pctDecode(key) for key in args.delete]
+		metadata = ktxjuggle.editMetadata(inPath, outPath, setPairs, deleteKeys, not args.noalign)
+	else:
+		metadata = ktxjuggle.readMetadata(inPath, not args.noalign)
+
+	if args.list:
+		for key, value in metadata:
+			print(f'{binary.pctEncode(key).replace("=", "%3D")}={binary.pctEncode(value)}')
+
+
 if __name__ == '__main__':
 	main()
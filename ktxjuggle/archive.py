@@ -0,0 +1,175 @@
+import contextlib
+import io
+import logging
+import posixpath
+import queue
+import tarfile
+import threading
+import time
+
+from ktxjuggle.ktx import Ktx
+
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def isArchive(name):
+	return str(name) == '-' or str(name).lower().endswith(SUFFIXES)
+
+
+def writeMode(name):
+	name = str(name).lower()
+	if name.endswith(('.gz', '.tgz')):
+		return 'w|gz'
+	if name.endswith(('.bz2', '.tbz2')):
+		return 'w|bz2'
+	if name.endswith(('.xz', '.txz')):
+		return 'w|xz'
+	return 'w|'
+
+
+class MemoryPath:
+	# Minimal stand-in for pathlib.Path, to keep sidecars in memory
+
+	def __init__(self, files, path=''):
+		self.files = files
+		self.path = path
+		self.reads = set()
+
+	def joinpath(self, name):
+		path = MemoryPath(self.files, posixpath.normpath(posixpath.join(self.path, name)))
+		path.reads = self.reads
+		return path
+
+	def read_bytes(self):
+		if self.path not in self.files:
+			raise FileNotFoundError('Missing sidecar in archive: ' + self.path)
+		self.reads.add(self.path)
+		return self.files[self.path]
+
+	def write_bytes(self, b):
+		self.files[self.path] = b
+
+
+def putEntry(entries, entry, stop):
+	# Like entries.put, but gives up once the conversion has stopped
+	while not stop.is_set():
+		with contextlib.suppress(queue.Full):
+			entries.put(entry, timeout=0.1)
+			return
+
+
+def readEntries(inStream, entries, stop):
+	# Runs in a separate thread, so that reading and
+	# decompression overlap with the conversion
+	try:
+		with tarfile.open(fileobj=inStream, mode='r|*') as inTar:
+			for member in inTar:
+				if stop.is_set():
+					return
+				if member.isfile():
+					putEntry(entries, (member.name, inTar.extractfile(member).read()), stop)
+		putEntry(entries, None, stop)
+	except BaseException as e:
+		putEntry(entries, e, stop)
+
+
+def convertArchive(inStream, outStream, outMode='w|', maxInline=16, isAligned=True,
+		isJsonLines=False, bufferSize=16):
+	# Converts each .ktx entry to .json (or .jsonl), and each .json(l) entry to .ktx.
+	# Other entries are kept as sidecars for the .json entries,
+	# and copied as is if no .json entry references them.
+	# Returns the number of entries that failed to convert.
+	entries = queue.Queue(maxsize=bufferSize)
+	stop = threading.Event()
+	reader = threading.Thread(target=readEntries, args=(inStream, entries, stop), daemon=True)
+	reader.start()
+	try:
+		return convertEntries(entries, outStream, outMode, maxInline, isAligned, isJsonLines)
+	finally:
+		# End the reader, also if the conversion failed. A reader that is
+		# blocked on an idle input stream is left behind as a daemon.
+		stop.set()
+		with contextlib.suppress(queue.Empty):
+			while True:
+				entries.get_nowait()
+		reader.join(timeout=1)
+
+
+def convertEntries(entries, outStream, outMode, maxInline, isAligned, isJsonLines):
+
+	sidecars = {}
+	pending = []
+	failures = 0
+	with tarfile.open(fileobj=outStream, mode=outMode) as outTar:
+
+		def addEntry(name, data):
+			info = tarfile.TarInfo(name)
+			info.size = len(data)
+			info.mtime = int(time.time())
+			outTar.addfile(info, io.BytesIO(data))
+
+		def convert(name, data, isLast):
+			stem, suffix = posixpath.splitext(name)
+			if suffix == '.ktx':
+				ktx = Ktx.fromBuffer(data, isAligned)
+				outFiles = {}
+				outDir = MemoryPath(outFiles, posixpath.dirname(name))
+				jsonStream = io.StringIO()
+				if isJsonLines:
+					ktx.toJsonLines(jsonStream, outDir, posixpath.basename(stem), maxInline)
+				else:
+					ktx.toJson(jsonStream, outDir, posixpath.basename(stem), maxInline)
+				# Sidecars first, so that a streaming reader can convert immediately
+				for sidecarName, sidecar in outFiles.items():
+					addEntry(sidecarName, sidecar)
+				addEntry(stem + ('.jsonl' if isJsonLines else '.json'), jsonStream.getvalue().encode())
+			else:
+				inDir = MemoryPath(sidecars, posixpath.dirname(name))
+				try:
+					if suffix == '.jsonl':
+						ktx = Ktx.fromJsonLines(io.StringIO(data.decode()), inDir)
+					else:
+						ktx = Ktx.fromJson(io.StringIO(data.decode()), inDir)
+				except FileNotFoundError:
+					if isLast:
+						raise
+					pending.append((name, data))
+					return
+				addEntry(stem + '.ktx', ktx.toBuffer(isAligned=isAligned))
+				for sidecarName in inDir.reads:
+					sidecars.pop(sidecarName, None)
+			logger.info('Converted %s', name)
+
+		def tryConvert(name, data, isLast=False):
+			nonlocal failures
+			try:
+				convert(name, data, isLast)
+			except Exception as e:
+				logger.error('%s: %s', name, e)
+				failures += 1
+
+		while True:
+			entry = entries.get()
+			if entry is None:
+				break
+			if isinstance(entry, BaseException):
+				raise entry
+			name, data = entry
+			name = posixpath.normpath(name)
+			if name.endswith(('.ktx', '.json', '.jsonl')):
+				tryConvert(name, data)
+			else:
+				sidecars[name] = data
+
+		# JSON entries whose sidecars came later in the archive
+		for name, data in pending:
+			tryConvert(name, data, isLast=True)
+
+		for name, data in sidecars.items():
+			logger.info('Copied unreferenced entry %s', name)
+			addEntry(name, data)
+
+	return failures
@@ -14,15 +14,8 @@ class Reader:
 			return True
 		return False
 
-	def bytes(self, size, wordSize=1):
-		if self.endian == 'big' and wordSize > 1:
-			b = bytearray()
-			for _ in range(size // wordSize):
-				b.extend(reversed(self.stream.read(wordSize)))
-			b.extend(reversed(self.stream.read(size % wordSize)))
-		else:
-			b = self.stream.read(size)
-
+	def bytes(self, size):
+		b = self.stream.read(size)
 		if len(b) != size:
 			raise EOFError('Unexpected EOF')
 		return b
@@ -41,12 +34,13 @@ class Writer:
 		self.stream = stream
 		self.endian = 'little'
 
-	def bytes(self, b, wordSize=1):
-		if self.endian == 'big' and wordSize > 1:
-			for i in range(0, len(b), wordSize):
-				self.stream.write(bytes(reversed(b[i:i+wordSize])))
-		else:
-			self.stream.write(b)
+	def bytes(self, b):
+		self.stream.write(b)
+
+	def swappedBytes(self, b, wordSize):
+		swapped = bytearray(len(b))
+		swapWords(b, swapped, wordSize)
+		self.bytes(swapped)
 
 	def uint32(self, i):
 		self.bytes(i.to_bytes(4, byteorder=self.endian, signed=False))
@@ -56,6 +50,65 @@ class Writer:
 		self.bytes(b'\0' * padding)
 
 
+class BufferReader:
+	# Like Reader, but on a buffer, and bytes returns views into it
+
+	def __init__(self, buffer):
+		self.view = memoryview(buffer).cast('B')
+		self.offset = 0
+		self.endian = 'little'
+
+	def __bool__(self):
+		return self.offset < len(self.view)
+
+	def bytes(self, size):
+		if self.offset + size > len(self.view):
+			raise EOFError('Unexpected EOF')
+		self.offset += size
+		return self.view[self.offset - size:self.offset]
+
+	def uint32(self):
+		return int.from_bytes(self.bytes(4), byteorder=self.endian, signed=False)
+
+	def align(self, size):
+		padding = (size - (self.offset % size)) % size
+		self.bytes(padding)
+
+
+class BufferWriter:
+	# Like Writer, but into a buffer that is large enough
+
+	def __init__(self, buffer):
+		self.view = memoryview(buffer).cast('B')
+		self.offset = 0
+		self.endian = 'little'
+
+	def bytes(self, b):
+		self.view[self.offset:self.offset + len(b)] = b
+		self.offset += len(b)
+
+	def swappedBytes(self, b, wordSize):
+		# Swaps directly into the buffer
+		swapWords(b, self.view[self.offset:self.offset + len(b)], wordSize)
+		self.offset += len(b)
+
+	def uint32(self, i):
+		self.bytes(i.to_bytes(4, byteorder=self.endian, signed=False))
+
+	def align(self, size):
+		padding = (size - (self.offset % size)) % size
+		self.bytes(b'\0' * padding)
+
+
+def swapWords(source, target, wordSize):
+	# Copies source into target and reverses the byte order of each
+	# word, including the incomplete last word
+	whole = len(source) - len(source) % wordSize
+	for i in range(wordSize):
+		target[i:whole:wordSize] = source[wordSize - 1 - i:whole:wordSize]
+	target[whole:len(source)] = source[whole:][::-1]
+
+
 def pctEncode(binary, allowPrintable=True):
 	string = ''
 	for b in binary:
@@ -81,26 +134,124 @@ def pctDecode(string):
 	return bytes(binary)
 
 
+def isEqual(view, offset1, offset2, size):
+	# Compares in growing chunks, for an early exit and bounded copies
+	i, chunk = 0, 64
+	while i < size:
+		end = min(i + chunk, size)
+		if view[offset1 + i:offset1 + end].tobytes() != view[offset2 + i:offset2 + end].tobytes():
+			return False
+		i, chunk = end, min(chunk*2, 1 << 20)
+	return True
+
+
+def isPeriodic(view, length):
+	return isEqual(view, length, 0, len(view) - length)
+
+
 def findPattern(b, maxLength):
-	for length in range(1, maxLength + 1):
-		if len(b) % length == 0:
-			pattern = b[0:length]
-			for offset in range(length, len(b), length):
-				if b[offset:offset + length] != pattern:
-					pattern = None
-					break
-			if pattern:
-				return pattern
+	view = memoryview(b)
+	for length in range(1, min(maxLength, len(b)) + 1):
+		if len(b) % length == 0 and isPeriodic(view, length):
+			return bytes(view[0:length])
 	return None
 
 
+def findPeriod(b, minLength):
+	# Smallest divisor of len(b), not below minLength, by which b repeats
+	view = memoryview(b)
+	size = len(b)
+	divisors = set()
+	i = 1
+	while i*i <= size:
+		if size % i == 0:
+			divisors.update((i, size // i))
+		i += 1
+	for length in sorted(divisors):
+		if minLength <= length < size and isPeriodic(view, length):
+			return length
+	return size
+
+
+def repeatExtent(b, start, length):
+	# Number of bytes after b[start:start+length] that continue the repetition
+	view = memoryview(b)
+	limit = len(b) - start - length
+	low, high, step = 0, limit, length
+	while low < high:
+		end = min(low + step, high)
+		if isEqual(view, start + length + low, start + low, end - low):
+			low = end
+			step *= 2
+		else:
+			high = end - 1
+			break
+	while low < high:
+		mid = (low + high + 1) // 2
+		if isEqual(view, start + length + low, start + low, mid - low):
+			low = mid
+		else:
+			high = mid - 1
+	return low
+
+
+def findRuns(b, maxLength):
+	# Greedy list of (pattern, repeats), with at most maxLength pattern bytes
+	runs = []
+	literal = bytearray()
+	budget = maxLength
+	i = 0
+	while i < len(b):
+		bestLength, bestRepeats = 1, 1
+		for length in range(1, min(budget, len(b) - i) + 1):
+			repeats = 1 + repeatExtent(b, i, length) // length
+			if (repeats - 1)*length > (bestRepeats - 1)*bestLength:
+				bestLength, bestRepeats = length, repeats
+				if length*repeats == len(b) - i:
+					break
+		if bestRepeats == 1:
+			literal.append(b[i])
+			i += 1
+		else:
+			if literal:
+				runs.append((bytes(literal), 1))
+				literal = bytearray()
+			runs.append((bytes(b[i:i + bestLength]), bestRepeats))
+			i += bestLength*bestRepeats
+		budget -= bestLength
+		if budget < 0:
+			return None
+	if literal:
+		runs.append((bytes(literal), 1))
+	return runs
+
+
+def encodeRuns(runs):
+	return ','.join(
+		pctEncode(pattern, allowPrintable=False) + (f'*{repeats}' if repeats > 1 else '')
+		for pattern, repeats in runs)
+
+
+def decodeRuns(string):
+	runs = []
+	for run in string.split(','):
+		pattern, _, repeats = run.partition('*')
+		if not pattern.startswith('%') or (repeats and not repeats.isdigit()):
+			raise ValueError('Invalid inline image encoding: ' + string)
+		runs.append((pctDecode(pattern), int(repeats) if repeats else 1))
+	return runs
+
+
 def nameToBytes(size, name, directory):
 	if name.startswith('%'):
-		pattern = pctDecode(name)
-		repeats = size // len(pattern)
-		if len(pattern)*repeats != size:
+		runs = decodeRuns(name)
+		# Check the size before expanding, to never allocate more than size
+		length = sum(len(pattern)*repeats for pattern, repeats in runs)
+		if size == 0:
+			return b''
+		if length == 0 or length > size or size % length != 0:
 			raise ValueError('Pattern does not fit into image size: ' + name)
-		return pattern * repeats
+		return b''.join(pattern*repeats for pattern, repeats in runs) * (size // length)
 	else:
 		return directory.joinpath(name).read_bytes()
 
@@ -109,7 +260,13 @@ def bytesToName(b, name, directory, maxInline):
 	pattern = findPattern(b, maxInline)
 	if pattern:
 		return pctEncode(pattern, allowPrintable=False)
-	else:
-		if directory:
-			directory.joinpath(name).write_bytes(b)
-		return name
+	if b and maxInline > 0:
+		# Encode one period (row, slice, or whole image) as runs,
+		# which are repeated to fill the image when decoded
+		period = findPeriod(b, maxInline + 1)
+		runs = findRuns(memoryview(b)[:period], maxInline)
+		if runs:
+			return encodeRuns(runs)
+	if directory:
+		directory.joinpath(name).write_bytes(b)
+	return name
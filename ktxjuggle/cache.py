@@ -0,0 +1,221 @@
+import contextlib
+import contextvars
+import hashlib
+import io
+import json
+import logging
+import os
+import pathlib
+import tarfile
+import tempfile
+import time
+
+import ktxjuggle
+from ktxjuggle import archive
+from ktxjuggle.ktx import Ktx
+
+
+logger = logging.getLogger(__name__)
+
+# The record list of the conversion in the current thread, if any
+recording = contextvars.ContextVar('recording', default=None)
+
+
+class Cache:
+	# Converted files, keyed by a hash of the input files and options.
+	# Entries are written atomically, and the least recently used
+	# entries are evicted once maxSize is exceeded. Several processes
+	# may share the same directory.
+
+	SUFFIX = '.tar'
+	TEMP_SUFFIX = '.tmp'
+	TEMP_AGE = 3600  # seconds, after which a temporary file is left over from a crash
+
+	def __init__(self, directory, maxSize=1 << 30):
+		self.directory = pathlib.Path(directory)
+		self.maxSize = maxSize
+		self.directory.mkdir(parents=True, exist_ok=True)
+
+	def key(self, inPath, options):
+		digest = hashlib.sha256(repr(options).encode())
+		for path in inputPaths(pathlib.Path(inPath)):
+			try:
+				with open(path, mode='rb') as stream:
+					digest.update(f'\0{path.name}\0{os.fstat(stream.fileno()).st_size}\0'.encode())
+					for chunk in iter(lambda: stream.read(1 << 20), b''):
+						digest.update(chunk)
+			except FileNotFoundError:
+				digest.update(f'\0{path.name}\0missing\0'.encode())
+		return digest.hexdigest()
+
+	def load(self, key, level):
+		# Returns (files, records), or None on a miss. An entry that
+		# was recorded above level lacks records, and is also a miss.
+		path = self.directory / (key + self.SUFFIX)
+		try:
+			data = path.read_bytes()
+			with contextlib.suppress(OSError):
+				os.utime(path)
+			files = {}
+			records = []
+			with tarfile.open(fileobj=io.BytesIO(data), mode='r:') as entryTar:
+				for member in entryTar:
+					content = entryTar.extractfile(member).read()
+					if member.name == 'records.json':
+						recorded = json.loads(content.decode())
+						if recorded['level'] > level:
+							return None
+						records = recorded['records']
+					else:
+						files[member.name[len('files/'):]] = content
+			logger.info('Cache hit: %s', key)
+			return files, records
+		except (OSError, ValueError, KeyError, TypeError, tarfile.TarError):
+			return None
+
+	def store(self, key, files, records, level):
+		# A failure is logged, but does not fail the conversion
+		tempName = None
+		try:
+			fd, tempName = tempfile.mkstemp(dir=self.directory, suffix=self.TEMP_SUFFIX)
+			with open(fd, mode='wb') as stream:
+				with tarfile.open(fileobj=stream, mode='w:') as entryTar:
+					for name, content in files.items():
+						addMember(entryTar, 'files/' + name, content)
+					addMember(entryTar, 'records.json', json.dumps({'level': level, 'records': records}).encode())
+			os.replace(tempName, self.directory / (key + self.SUFFIX))
+			tempName = None
+			self.evict()
+		except OSError as e:
+			logger.warning('Cache store failed: %s', e)
+		finally:
+			if tempName:
+				with contextlib.suppress(FileNotFoundError):
+					os.remove(tempName)
+
+	def convertFile(self, inPath, outPath=None, maxInline=16, isAligned=True, workers=1):
+		# Converts like the command line. If outPath is None,
+		# then the JSON is returned instead of written.
+		inPath = pathlib.Path(inPath)
+		outPath = pathlib.Path(outPath) if outPath else None
+		outName = outPath.name if outPath else ''
+		imageStem = outPath.stem if outPath else inPath.stem
+
+		options = (ktxjuggle.__version__, inPath.suffix, outName, imageStem, maxInline, isAligned)
+		key = self.key(inPath, options)
+		level = logging.getLogger('ktxjuggle').getEffectiveLevel()
+		entry = self.load(key, level)
+		if entry:
+			files, records = entry
+			replayLogs(records)
+		else:
+			with recordLogs() as records:
+				ktx = Ktx.fromFile(inPath, isAligned, workers)
+				files = convertToFiles(ktx, outName, imageStem, maxInline, isAligned, workers)
+			self.store(key, files, records, level)
+
+		if not outPath:
+			return files['-'].decode()
+		outPath.parent.mkdir(parents=True, exist_ok=True)
+		for name, content in files.items():
+			outPath.parent.joinpath(name).write_bytes(content)
+		return None
+
+	def evict(self):
+		entries = []
+		tempSize = 0
+		for path in self.directory.glob('*' + self.TEMP_SUFFIX):
+			with contextlib.suppress(FileNotFoundError):
+				stat = path.stat()
+				if stat.st_mtime < time.time() - self.TEMP_AGE:
+					path.unlink()
+					logger.info('Cache removed left over file: %s', path.name)
+				else:
+					tempSize += stat.st_size
+		for path in self.directory.glob('*' + self.SUFFIX):
+			with contextlib.suppress(FileNotFoundError):
+				stat = path.stat()
+				entries.append((stat.st_mtime, stat.st_size, path))
+		totalSize = tempSize + sum(size for _, size, _ in entries)
+		for _, size, path in sorted(entries):
+			if totalSize <= self.maxSize:
+				break
+			with contextlib.suppress(FileNotFoundError):
+				path.unlink()
+				logger.info('Cache evicted: %s', path.stem)
+			totalSize -= size
+
+
+class RecordHandler(logging.Handler):
+	# Installed once, and appends to the record list of the current
+	# thread, so that concurrent conversions neither change the
+	# logger state nor see each other's records
+
+	def emit(self, record):
+		records = recording.get()
+		if records is not None:
+			records.append((record.name, record.levelno, record.getMessage()))
+
+
+logging.getLogger('ktxjuggle').addHandler(RecordHandler())
+
+
+@contextlib.contextmanager
+def recordLogs():
+	# Yields a list of (logger name, level, message), for replayLogs
+	records = []
+	token = recording.set(records)
+	try:
+		yield records
+	finally:
+		recording.reset(token)
+
+
+def replayLogs(records):
+	for name, level, message in records:
+		logging.getLogger(name).log(level, '%s', message)
+
+
+def addMember(tar, name, content):
+	info = tarfile.TarInfo(name)
+	info.size = len(content)
+	tar.addfile(info, io.BytesIO(content))
+
+
+def inputPaths(inPath):
+	# The input file, and the sidecars that it references
+	paths = [inPath]
+	if inPath.suffix == '.json':
+		with open(inPath, mode='r') as stream:
+			levels = json.load(stream).get('levels', [])
+	elif inPath.suffix == '.jsonl':
+		with open(inPath, mode='r') as stream:
+			levels = [json.loads(line) for line in stream if '"imageSize"' in line]
+	else:
+		levels = []
+	for level in levels:
+		for name in level['images']:
+			if not name.startswith('%'):
+				paths.append(inPath.parent / name)
+	return paths
+
+
+def convertToFiles(ktx, outName, imageStem, maxInline=16, isAligned=True, workers=1):
+	# Returns {name: bytes} for the output file and its sidecars.
+	# If outName is empty, then the JSON is stored as '-', without sidecars.
+	files = {}
+	outPath = pathlib.PurePosixPath(outName or '-.json')
+	imageDir = archive.MemoryPath(files) if outName else None
+	if outPath.suffix == '.ktx':
+		content = ktx.toBuffer(isAligned=isAligned)
+	elif outPath.suffix in ('.json', '.jsonl'):
+		stream = io.StringIO()
+		if outPath.suffix == '.json':
+			ktx.toJson(stream, imageDir, imageStem, maxInline, workers)
+		else:
+			ktx.toJsonLines(stream, imageDir, imageStem, maxInline, workers)
+		content = stream.getvalue().encode()
+	else:
+		raise ValueError('Output file must be .ktx, .json, or .jsonl')
+	files[outName or '-'] = bytes(content)
+	return files
@@ -1,8 +1,10 @@
 import collections
+import concurrent.futures
 import io
 import json
 import logging
 import math
+import pathlib
 
 from ktxjuggle import binary
 from ktxjuggle import opengl as gl
@@ -11,6 +13,83 @@ from ktxjuggle import opengl as gl
 logger = logging.getLogger(__name__)
 
 
+def unpackMetadata(metaBytes, endian='little', isAligned=True):
+	metadata = []
+	metaReader = binary.Reader(io.BytesIO(metaBytes))
+	metaReader.endian = endian
+	while metaReader:
+		try:
+			keyAndValueByteSize = metaReader.uint32()
+			if keyAndValueByteSize == 0:
+				logger.warning('keyAndValueByteSize is 0')
+				break
+			keyAndValue = metaReader.bytes(keyAndValueByteSize)
+			if isAligned:
+				metaReader.align(4)
+			if b'\0' in keyAndValue:
+				key, value = keyAndValue.split(b'\0', maxsplit=1)
+				metadata.append((key, value))
+			else:
+				logger.warning('keyAndValue is missing a NUL separator')
+		except EOFError:
+			logger.warning('keyAndValueByteSize overruns bytesOfKeyValueData')
+			break
+	return metadata
+
+
+def packMetadata(metadata, endian='little', isAligned=True):
+	metaStream = io.BytesIO()
+	metaWriter = binary.Writer(metaStream)
+	metaWriter.endian = endian
+	for key, value in metadata:
+		keyAndValue = key + b'\0' + value
+		metaWriter.uint32(len(keyAndValue))
+		metaWriter.bytes(keyAndValue)
+		if isAligned:
+			metaWriter.align(4)
+	return metaStream.getvalue()
+
+
+def swapImage(image, endian, wordSize):
+	# Big endian images are stored as words of glTypeSize bytes
+	if endian == 'big' and wordSize > 1:
+		swapped = bytearray(len(image))
+		binary.swapWords(image, swapped, wordSize)
+		return bytes(swapped)
+	return image
+
+
+def imageName(imageStem, mip, face, faceCount):
+	if faceCount == 1:
+		return f'{imageStem}.{mip}.bin'
+	return f'{imageStem}.{mip}.{face}.bin'
+
+
+def mapConcurrent(function, tasks, workers=1):
+	# Like map, but on a thread pool. Results are in task order.
+	if workers > 1 and len(tasks) > 1:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+			return list(executor.map(function, *zip(*tasks)))
+	return [function(*task) for task in tasks]
+
+
+def readImages(levelNames, imageDir, workers=1):
+	# [(int, [str])] to [(int, [bytes])]
+	tasks = [(imageSize, name, imageDir) for imageSize, names in levelNames for name in names]
+	images = iter(mapConcurrent(binary.nameToBytes, tasks, workers))
+	return [(imageSize, [next(images) for _ in names]) for imageSize, names in levelNames]
+
+
+def writeImages(levels, imageDir, imageStem, maxInline, workers=1):
+	# [(int, [bytes])] to [[str]]
+	tasks = [
+		(image, imageName(imageStem, mip, face, len(images)), imageDir, maxInline)
+		for mip, (_, images) in enumerate(levels)
+		for face, image in enumerate(images)]
+	names = iter(mapConcurrent(binary.bytesToName, tasks, workers))
+	return [[next(names) for _ in images] for _, images in levels]
+
+
 class Ktx:
 
 	IDENTIFIER = b'\xABKTX 11\xBB\r\n\x1A\n'
@@ -35,49 +114,28 @@ class Ktx:
 
 	@classmethod
 	def fromBinary(cls, stream, isAligned=True):
+		return cls.fromReader(binary.Reader(stream), isAligned)
+
+	@classmethod
+	def fromBuffer(cls, buffer, isAligned=True):
+		# Images are copied out of the buffer, so that it can
+		# be released (e.g. shared memory) while ktx is alive
+		return cls.fromReader(binary.BufferReader(buffer), isAligned)
+
+	@classmethod
+	def fromReader(cls, reader, isAligned=True):
 		ktx = cls()
-		reader = binary.Reader(stream)
 
-		ktx.identifier = reader.bytes(12)
+		ktx.identifier = bytes(reader.bytes(12))
 		ktx.endianness = reader.uint32()
 		if ktx.endianness == 0x01020304:
 			reader.endian = 'big'
 			logger.info('Input is big endian')
 
-		ktx.glType                = reader.uint32()
-		ktx.glTypeSize            = reader.uint32()
-		ktx.glFormat              = reader.uint32()
-		ktx.glInternalFormat      = reader.uint32()
-		ktx.glBaseInternalFormat  = reader.uint32()
-		ktx.pixelWidth            = reader.uint32()
-		ktx.pixelHeight           = reader.uint32()
-		ktx.pixelDepth            = reader.uint32()
-		ktx.numberOfArrayElements = reader.uint32()
-		ktx.numberOfFaces         = reader.uint32()
-		ktx.numberOfMipmapLevels  = reader.uint32()
-		ktx.bytesOfKeyValueData   = reader.uint32()
-
-		metaBytes  = reader.bytes(ktx.bytesOfKeyValueData)
-		metaStream = io.BytesIO(metaBytes)
-		metaReader = binary.Reader(metaStream)
-		metaReader.endian = reader.endian
-		while metaReader:
-			try:
-				keyAndValueByteSize = metaReader.uint32()
-				if keyAndValueByteSize == 0:
-					logger.warning('keyAndValueByteSize is 0')
-					break
-				keyAndValue = metaReader.bytes(keyAndValueByteSize)
-				if isAligned:
-					metaReader.align(4)
-				if b'\0' in keyAndValue:
-					key, value = keyAndValue.split(b'\0', maxsplit=1)
-					ktx.metadata.append((key, value))
-				else:
-					logger.warning('keyAndValue is missing a NUL separator')
-			except EOFError:
-				logger.warning('keyAndValueByteSize overruns bytesOfKeyValueData')
-				break
+		ktx.readHeaderFields(reader.uint32)
+
+		metaBytes = bytes(reader.bytes(ktx.bytesOfKeyValueData))
+		ktx.metadata = unpackMetadata(metaBytes, reader.endian, isAligned)
 
 		levelCount = ktx.numberOfMipmapLevels
 		if levelCount == 0 or ktx.isOESCPT():
@@ -87,7 +145,7 @@ class Ktx:
 				imageSize = reader.uint32()
 				images = []
 				for face in range(6 if ktx.isNonArrayCubemap() else 1):
-					images.append(reader.bytes(imageSize, ktx.glTypeSize))
+					images.append(bytes(swapImage(reader.bytes(imageSize), reader.endian, ktx.glTypeSize)))
 					if isAligned:
 						reader.align(4)
 				ktx.levels.append((imageSize, images))
@@ -102,77 +160,92 @@ class Ktx:
 		return ktx
 
 	@classmethod
-	def fromJson(cls, stream, imageDir):
+	def fromFile(cls, path, isAligned=True, workers=1):
+		path = pathlib.Path(path)
+		if path.suffix == '.ktx':
+			with open(path, mode='rb') as stream:
+				return cls.fromBinary(stream, isAligned)
+		elif path.suffix == '.json':
+			with open(path, mode='r') as stream:
+				return cls.fromJson(stream, path.parent, workers)
+		elif path.suffix == '.jsonl':
+			with open(path, mode='r') as stream:
+				return cls.fromJsonLines(stream, path.parent, workers)
+		else:
+			raise ValueError('Input file must be .ktx, .json, or .jsonl')
+
+	@classmethod
+	def fromJson(cls, stream, imageDir, workers=1):
 		ktx = cls()
 		js = json.load(stream, object_pairs_hook=collections.OrderedDict)
 
 		if js['format'] != "KTX 11":
 			raise ValueError('Unkown format: ' + js['format'])
 
-		header = js['header']
-		ktx.identifier            = binary.pctDecode(header['identifier'])
-		ktx.endianness            = int(header['endianness'], 0)
-		ktx.glType                = gl.getValue(header['glType'])
-		ktx.glTypeSize            = int(header['glTypeSize'])
-		ktx.glFormat              = gl.getValue(header['glFormat'])
-		ktx.glInternalFormat      = gl.getValue(header['glInternalFormat'])
-		ktx.glBaseInternalFormat  = gl.getValue(header['glBaseInternalFormat'])
-		ktx.pixelWidth            = int(header['pixelWidth'])
-		ktx.pixelHeight           = int(header['pixelHeight'])
-		ktx.pixelDepth            = int(header['pixelDepth'])
-		ktx.numberOfArrayElements = int(header['numberOfArrayElements'])
-		ktx.numberOfFaces         = int(header['numberOfFaces'])
-		ktx.numberOfMipmapLevels  = int(header['numberOfMipmapLevels'])
-		ktx.bytesOfKeyValueData   = int(header['bytesOfKeyValueData'])
+		ktx.parseJsonHeader(js['header'])
 
 		if 'metadata' in js:
 			for key, value in js['metadata']:
 				ktx.metadata.append((binary.pctDecode(key), binary.pctDecode(value)))
 
 		if 'levels' in js:
-			for level in js['levels']:
-				imageSize = int(level['imageSize'])
-				images = []
-				for imageName in level['images']:
-					images.append(binary.nameToBytes(imageSize, imageName, imageDir))
-				ktx.levels.append((imageSize, images))
+			levelNames = [(int(level['imageSize']), level['images']) for level in js['levels']]
+			ktx.levels = readImages(levelNames, imageDir, workers)
 
 		ktx.validate()
 		return ktx
 
-	def toBinary(self, stream, isAligned=True):
-		writer = binary.Writer(stream)
+	@classmethod
+	def fromJsonLines(cls, stream, imageDir, workers=1):
+		# Compact schema, parsed one line at a time:
+		# {"format":"KTX 11","header":{...}}
+		# {"metadata":["key","value"]}
+		# {"imageSize":123,"images":["name",...]}
+		ktx = cls()
+		js = json.loads(stream.readline())
+		if js.get('format') != "KTX 11":
+			raise ValueError('Unkown format: ' + str(js.get('format')))
+		ktx.parseJsonHeader(js['header'])
+
+		levelNames = []
+		for line in stream:
+			if not line.strip():
+				continue
+			js = json.loads(line)
+			if 'metadata' in js:
+				key, value = js['metadata']
+				ktx.metadata.append((binary.pctDecode(key), binary.pctDecode(value)))
+			elif 'imageSize' in js:
+				levelNames.append((int(js['imageSize']), js['images']))
+			else:
+				raise ValueError('Unknown JSON line: ' + line.strip())
+		ktx.levels = readImages(levelNames, imageDir, workers)
+
+		ktx.validate()
+		return ktx
 
+	def toBinary(self, stream, isAligned=True):
+		self.toWriter(binary.Writer(stream), isAligned)
+
+	def toBuffer(self, buffer=None, isAligned=True):
+		size = self.binarySize(isAligned)
+		if buffer is None:
+			buffer = bytearray(size)
+		if memoryview(buffer).nbytes < size:
+			raise ValueError(f'Buffer is too small for {size} bytes')
+		self.toWriter(binary.BufferWriter(buffer), isAligned)
+		return buffer
+
+	def toWriter(self, writer, isAligned=True):
 		writer.bytes(self.identifier)
 		writer.uint32(self.endianness)
 		if self.endianness == 0x01020304:
 			writer.endian = 'big'
 			logger.info('Output is big endian')
 
-		writer.uint32(self.glType)
-		writer.uint32(self.glTypeSize)
-		writer.uint32(self.glFormat)
-		writer.uint32(self.glInternalFormat)
-		writer.uint32(self.glBaseInternalFormat)
-		writer.uint32(self.pixelWidth)
-		writer.uint32(self.pixelHeight)
-		writer.uint32(self.pixelDepth)
-		writer.uint32(self.numberOfArrayElements)
-		writer.uint32(self.numberOfFaces)
-		writer.uint32(self.numberOfMipmapLevels)
-		writer.uint32(self.bytesOfKeyValueData)
-
-		metaStream = io.BytesIO()
-		metaWriter = binary.Writer(metaStream)
-		metaWriter.endian = writer.endian
-		for key, value in self.metadata:
-			keyAndValue = key + b'\0' + value
-			metaWriter.uint32(len(keyAndValue))
-			metaWriter.bytes(keyAndValue)
-			if isAligned:
-				metaWriter.align(4)
+		self.writeHeaderFields(writer.uint32)
 
-		metaBytes = metaStream.getvalue()
+		metaBytes = packMetadata(self.metadata, writer.endian, isAligned)
 		metaSized = bytearray(self.bytesOfKeyValueData)
 		metaSized[:len(metaBytes)] = metaBytes[:len(metaSized)]
 		writer.bytes(metaSized)
@@ -180,11 +253,25 @@ class Ktx:
 		for imageSize, images in self.levels:
 			writer.uint32(imageSize)
 			for image in images:
-				writer.bytes(image, self.glTypeSize)
+				# Big endian images are stored as words of glTypeSize bytes
+				if writer.endian == 'big' and self.glTypeSize > 1:
+					writer.swappedBytes(image, self.glTypeSize)
+				else:
+					writer.bytes(image)
 				if isAligned:
 					writer.align(4)
 
-	def toJson(self, stream, imageDir, imageStem, maxInline):
+	def binarySize(self, isAligned=True):
+		size = len(self.identifier) + 13*4 + self.bytesOfKeyValueData
+		for imageSize, images in self.levels:
+			size += 4
+			for image in images:
+				size += len(image)
+				if isAligned:
+					size += (4 - size % 4) % 4
+		return size
+
+	def toJson(self, stream, imageDir, imageStem, maxInline, workers=1):
 		stream.write(
 			f'{{\n'
 			f'  "format": "KTX 11",\n'
@@ -213,26 +300,95 @@ class Ktx:
 			stream.write('\n  ]')
 
 		if self.levels:
+			levelNames = writeImages(self.levels, imageDir, imageStem, maxInline, workers)
 			stream.write(',\n  "levels": [')
 			maxSizeLen = len(str(max(self.levels)[0]))
-			for mip, (imageSize, images) in enumerate(self.levels):
+			for mip, ((imageSize, _), names) in enumerate(zip(self.levels, levelNames)):
 				stream.write(',\n' if mip > 0 else '\n')
 				stream.write(f'    {{"imageSize": {imageSize: >{maxSizeLen}}, "images": [')
-				for face, image in enumerate(images):
-					if len(images) == 1:
-						name = f'{imageStem}.{mip}.bin'
-					else:
-						name = f'{imageStem}.{mip}.{face}.bin'
+				for face, name in enumerate(names):
+					if len(names) > 1:
 						stream.write(',\n      ' if face > 0 else '\n      ')
-					stream.write(f'"{binary.bytesToName(image, name, imageDir, maxInline)}"')
+					stream.write(f'"{name}"')
 				stream.write(']}')
 			stream.write('\n  ]')
 
 		stream.write('\n')
 		stream.write('}\n')
 
+	def toJsonLines(self, stream, imageDir, imageStem, maxInline, workers=1):
+		stream.write(
+			f'{{"format":"KTX 11","header":{{'
+			f'"identifier":"{binary.pctEncode(self.identifier)}",'
+			f'"endianness":"0x{self.endianness:08x}",'
+			f'"glType":"{gl.getName(self.glType)}",'
+			f'"glTypeSize":{self.glTypeSize},'
+			f'"glFormat":"{gl.getName(self.glFormat)}",'
+			f'"glInternalFormat":"{gl.getName(self.glInternalFormat)}",'
+			f'"glBaseInternalFormat":"{gl.getName(self.glBaseInternalFormat)}",'
+			f'"pixelWidth":{self.pixelWidth},'
+			f'"pixelHeight":{self.pixelHeight},'
+			f'"pixelDepth":{self.pixelDepth},'
+			f'"numberOfArrayElements":{self.numberOfArrayElements},'
+			f'"numberOfFaces":{self.numberOfFaces},'
+			f'"numberOfMipmapLevels":{self.numberOfMipmapLevels},'
+			f'"bytesOfKeyValueData":{self.bytesOfKeyValueData}'
+			f'}}}}\n')
+
+		for key, value in self.metadata:
+			stream.write(f'{{"metadata":["{binary.pctEncode(key)}","{binary.pctEncode(value)}"]}}\n')
+
+		levelNames = writeImages(self.levels, imageDir, imageStem, maxInline, workers)
+		for (imageSize, _), names in zip(self.levels, levelNames):
+			images = ','.join(f'"{name}"' for name in names)
+			stream.write(f'{{"imageSize":{imageSize},"images":[{images}]}}\n')
+
 	# Helpers
 
+	def readHeaderFields(self, readUint32):
+		self.glType                = readUint32()
+		self.glTypeSize            = readUint32()
+		self.glFormat              = readUint32()
+		self.glInternalFormat      = readUint32()
+		self.glBaseInternalFormat  = readUint32()
+		self.pixelWidth            = readUint32()
+		self.pixelHeight           = readUint32()
+		self.pixelDepth            = readUint32()
+		self.numberOfArrayElements = readUint32()
+		self.numberOfFaces         = readUint32()
+		self.numberOfMipmapLevels  = readUint32()
+		self.bytesOfKeyValueData   = readUint32()
+
+	def writeHeaderFields(self, writeUint32):
+		writeUint32(self.glType)
+		writeUint32(self.glTypeSize)
+		writeUint32(self.glFormat)
+		writeUint32(self.glInternalFormat)
+		writeUint32(self.glBaseInternalFormat)
+		writeUint32(self.pixelWidth)
+		writeUint32(self.pixelHeight)
+		writeUint32(self.pixelDepth)
+		writeUint32(self.numberOfArrayElements)
+		writeUint32(self.numberOfFaces)
+		writeUint32(self.numberOfMipmapLevels)
+		writeUint32(self.bytesOfKeyValueData)
+
+	def parseJsonHeader(self, header):
+		self.identifier            = binary.pctDecode(header['identifier'])
+		self.endianness            = int(header['endianness'], 0)
+		self.glType                = gl.getValue(header['glType'])
+		self.glTypeSize            = int(header['glTypeSize'])
+		self.glFormat              = gl.getValue(header['glFormat'])
+		self.glInternalFormat      = gl.getValue(header['glInternalFormat'])
+		self.glBaseInternalFormat  = gl.getValue(header['glBaseInternalFormat'])
+		self.pixelWidth            = int(header['pixelWidth'])
+		self.pixelHeight           = int(header['pixelHeight'])
+		self.pixelDepth            = int(header['pixelDepth'])
+		self.numberOfArrayElements = int(header['numberOfArrayElements'])
+		self.numberOfFaces         = int(header['numberOfFaces'])
+		self.numberOfMipmapLevels  = int(header['numberOfMipmapLevels'])
+		self.bytesOfKeyValueData   = int(header['bytesOfKeyValueData'])
+
 	def isOESCPT(self):
 		return 0x8B90 <= self.glInternalFormat <= 0x8B99
 
@@ -275,8 +431,6 @@ class Ktx:
 			logger.warning('numberOfMipmapLevels is too big')
 
 		metaKeys = set()
-		metaStream = io.BytesIO()
-		metaWriter = binary.Writer(metaStream)
 		for key, value in self.metadata:
 			if not key:
 				logger.info('metadata contains empty key (allowed, but weird)')
@@ -292,12 +446,8 @@ class Ktx:
 						logger.info('KTXorientation uses unrecommended value: %s', binary.pctEncode(value))
 				else:
 					logger.info('Unknown key name with reserved KTX prefix: %s', binary.pctEncode(key))
-			keyAndValue = key + b'\0' + value
-			metaWriter.uint32(len(keyAndValue))
-			metaWriter.bytes(keyAndValue)
-			metaWriter.align(4)
 			metaKeys.add(key)
-		if self.bytesOfKeyValueData != len(metaStream.getvalue()):
+		if self.bytesOfKeyValueData != len(packMetadata(self.metadata)):
 			logger.warning('bytesOfKeyValueData does not match the metadata content')
 
 		prevImageSize = 0xffffffff
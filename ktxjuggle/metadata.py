@@ -0,0 +1,124 @@
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+
+from ktxjuggle.ktx import Ktx, packMetadata, unpackMetadata
+
+
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = 64  # identifier, endianness, and 12 uint32 fields
+
+
+def readHeader(stream):
+	header = stream.read(HEADER_SIZE)
+	if len(header) != HEADER_SIZE:
+		raise EOFError('Unexpected EOF while reading header')
+	if header[:12] != Ktx.IDENTIFIER:
+		logger.warning('Invalid identifier')
+
+	endian = 'little'
+	if int.from_bytes(header[12:16], byteorder='little') == 0x01020304:
+		endian = 'big'
+		logger.info('Input is big endian')
+
+	bytesOfKeyValueData = int.from_bytes(header[60:64], byteorder=endian)
+	metaBytes = stream.read(bytesOfKeyValueData)
+	if len(metaBytes) != bytesOfKeyValueData:
+		raise EOFError('Unexpected EOF while reading metadata')
+	return header, endian, metaBytes
+
+
+def readMetadata(path, isAligned=True):
+	with open(path, mode='rb') as stream:
+		_, endian, metaBytes = readHeader(stream)
+	return unpackMetadata(metaBytes, endian, isAligned)
+
+
+def applyEdits(metadata, setPairs=(), deleteKeys=()):
+	# Deletes remove every occurrence of a key. Sets replace the
+	# first occurrence in place, or append if the key is missing.
+	deleteKeys = set(deleteKeys)
+	metadata = [(key, value) for key, value in metadata if key not in deleteKeys]
+	for key, value in setPairs:
+		for i, (oldKey, _) in enumerate(metadata):
+			if oldKey == key:
+				metadata[i] = (key, value)
+				break
+		else:
+			metadata.append((key, value))
+	return metadata
+
+
+def editMetadata(inPath, outPath=None, setPairs=(), deleteKeys=(), isAligned=True):
+	# Resolve symlinks, so that the linked file is replaced, not the link
+	inPath = pathlib.Path(inPath).resolve()
+	outPath = pathlib.Path(outPath).resolve() if outPath else inPath
+	isInPlace = outPath.exists() and outPath.samefile(inPath)
+
+	with open(inPath, mode='rb') as inStream:
+		header, endian, metaBytes = readHeader(inStream)
+		metadata = unpackMetadata(metaBytes, endian, isAligned)
+		metadata = applyEdits(metadata, setPairs, deleteKeys)
+		newMetaBytes = packMetadata(metadata, endian, isAligned)
+
+		if isInPlace and len(newMetaBytes) == len(metaBytes):
+			logger.info('Patching metadata in place')
+			with open(inPath, mode='r+b') as outStream:
+				outStream.seek(HEADER_SIZE)
+				outStream.write(newMetaBytes)
+			return metadata
+
+		newHeader = header[:60] + len(newMetaBytes).to_bytes(4, byteorder=endian)
+		imageOffset = HEADER_SIZE + len(metaBytes)
+		# Write to a temporary file, so that a failure leaves no partial output
+		outPath.parent.mkdir(parents=True, exist_ok=True)
+		fd, tempName = tempfile.mkstemp(dir=outPath.parent)
+		try:
+			with open(fd, mode='wb') as outStream:
+				outStream.write(newHeader + newMetaBytes)
+				copyRange(inStream, outStream, imageOffset)
+			shutil.copymode(inPath, tempName)
+		except BaseException:
+			os.remove(tempName)
+			raise
+
+	if isInPlace and os.stat(outPath).st_nlink > 1:
+		# Keep hard links, by copying back into the same inode.
+		# Unlike os.replace, this is not atomic.
+		try:
+			with open(tempName, mode='rb') as tempStream, open(outPath, mode='r+b') as outStream:
+				copyRange(tempStream, outStream, 0)
+				outStream.truncate(os.fstat(tempStream.fileno()).st_size)
+		finally:
+			os.remove(tempName)
+	else:
+		os.replace(tempName, outPath)
+	return metadata
+
+
+def copyRange(inStream, outStream, offset):
+	# Copies from offset to EOF, within the kernel if possible
+	outStream.flush()
+	inFd = inStream.fileno()
+	outFd = outStream.fileno()
+	end = os.fstat(inFd).st_size
+	outOffset = outStream.tell()
+	try:
+		while offset < end:
+			if hasattr(os, 'copy_file_range'):
+				copied = os.copy_file_range(inFd, outFd, end - offset, offset, outOffset)
+			else:
+				os.lseek(outFd, outOffset, os.SEEK_SET)
+				copied = os.sendfile(outFd, inFd, offset, end - offset)
+			if copied == 0:
+				break
+			offset += copied
+			outOffset += copied
+	except (AttributeError, OSError):
+		# No sendfile, or unsupported across file systems
+		inStream.seek(offset)
+		outStream.seek(outOffset)
+		shutil.copyfileobj(inStream, outStream)
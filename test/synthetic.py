@@ -0,0 +1,64 @@
+"""
+Writes small synthetic .ktx files, which cover uniform,
+repeated, random, cubemap, and big endian images.
+"""
+
+import random
+
+import ktxjuggle
+from ktxjuggle.ktx import packMetadata
+
+
+def makeKtx(width, height, faces=1, levels=1, typeSize=1, bigEndian=False, extra=0):
+	ktx = ktxjuggle.Ktx()
+	ktx.identifier            = ktxjuggle.Ktx.IDENTIFIER
+	ktx.endianness            = 0x01020304 if bigEndian else 0x04030201
+	ktx.glType                = 0x1401  # GL_UNSIGNED_BYTE
+	ktx.glTypeSize            = typeSize
+	ktx.glFormat              = 0x1908  # GL_RGBA
+	ktx.glInternalFormat      = 0x8058  # GL_RGBA8
+	ktx.glBaseInternalFormat  = 0x1908  # GL_RGBA
+	ktx.pixelWidth            = width
+	ktx.pixelHeight           = height
+	ktx.pixelDepth            = 0
+	ktx.numberOfArrayElements = 0
+	ktx.numberOfFaces         = faces
+	ktx.numberOfMipmapLevels  = levels
+	ktx.metadata              = [(b'KTXorientation', b'S=r,T=d\0'), (b'foo', b'bar')]
+	ktx.bytesOfKeyValueData   = len(packMetadata(ktx.metadata))
+
+	rand = random.Random(width*height*faces)
+	for level in range(levels):
+		size = max(1, width >> level) * max(1, height >> level) * 4 + extra
+		images = []
+		for face in range(faces):
+			kind = (level + face) % 4
+			if kind == 0:
+				image = bytes([face]) * size
+			elif kind == 1:
+				image = bytes(rand.getrandbits(8) for _ in range(size))
+			elif kind == 2:
+				image = b'\0' * (size // 2) + b'\xFF' * (size - size // 2)
+			else:
+				image = (bytes(range(8)) * (size // 8) + b'\1' * size)[:size]
+			images.append(image)
+		ktx.levels.append((size, images))
+	return ktx
+
+
+def writeSynthetic(directory):
+	directory.mkdir(parents=True, exist_ok=True)
+	ktxs = {
+		'plain':  makeKtx(64, 32, levels=3),
+		'cube':   makeKtx(16, 16, faces=6, levels=5),
+		'big':    makeKtx(8, 8, levels=4, bigEndian=True),
+		'words':  makeKtx(8, 8, levels=4, typeSize=4, bigEndian=True),
+		'halves': makeKtx(8, 8, levels=4, typeSize=2, extra=1),
+	}
+	paths = []
+	for name, ktx in ktxs.items():
+		path = directory / (name + '.ktx')
+		with open(path, mode='wb') as stream:
+			ktx.toBinary(stream)
+		paths.append(path)
+	return paths
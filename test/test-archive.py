@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Converts a tar archive of synthetic .ktx files to .json
+and .jsonl archives and back, and compares each entry,
+including an unrelated entry that must be copied as is.
+"""
+
+import pathlib
+import subprocess
+import tarfile
+
+import synthetic
+
+
+EXECUTABLE = 'ktxjuggle'
+TARGET_DIR = pathlib.Path('temp/archive')
+
+
+def readArchive(path):
+	with tarfile.open(path) as tar:
+		return {m.name: tar.extractfile(m).read() for m in tar if m.isfile()}
+
+
+def testArchiveRoundtrip(source, suffix, options):
+	json = TARGET_DIR / ('json' + suffix)
+	target = TARGET_DIR / ('ktx' + suffix)
+	subprocess.run([EXECUTABLE, '--log=WARNING'] + options + [source, json])
+	subprocess.run([EXECUTABLE, '--log=WARNING', json, target])
+	return readArchive(source) == readArchive(target)
+
+
+sources = synthetic.writeSynthetic(TARGET_DIR / 'source')
+readme = TARGET_DIR / 'source/README.txt'
+readme.write_text('Not a texture\n')
+source = TARGET_DIR / 'source.tar'
+with tarfile.open(source, mode='w') as tar:
+	for path in sources + [readme]:
+		tar.add(path, arcname=path.name)
+
+summary = '  OK'
+for suffix, options in (('.tar', []), ('.tar.gz', []), ('.jsonl.tar', ['--jsonl'])):
+	if testArchiveRoundtrip(source, suffix, options):
+		print('  ok ', suffix)
+	else:
+		print(' fail', suffix)
+		summary = ' FAIL'
+print(summary)
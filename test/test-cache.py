@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Converts synthetic .ktx files through a cache, at log level DEBUG,
+WARNING, and DEBUG again, and checks that the last run is a cache
+hit with identical output files and identical replayed warnings.
+Then converts them concurrently through one cache, and checks
+that each entry replays only the records of its own file.
+"""
+
+import concurrent.futures
+import logging
+import pathlib
+import shutil
+import subprocess
+import sys
+
+import ktxjuggle
+import synthetic
+
+
+EXECUTABLE = 'ktxjuggle'
+TARGET_DIR = pathlib.Path('temp/cache')
+CACHE_DIR  = TARGET_DIR / 'cache'
+
+
+def convert(source, target, log):
+	result = subprocess.run(
+		[EXECUTABLE, '--log=' + log, '--cache', CACHE_DIR, source, target],
+		stderr=subprocess.PIPE, universal_newlines=True)
+	lines = result.stderr.splitlines()
+	isHit = any(line.startswith('INFO: Cache hit') for line in lines)
+	warnings = [line for line in lines if line.startswith('WARNING')]
+	files = {path.name: path.read_bytes() for path in target.parent.iterdir()}
+	return isHit, warnings, files
+
+
+def testCache(source):
+	missDir = TARGET_DIR / 'miss' / source.stem
+	hitDir = TARGET_DIR / 'hit' / source.stem
+	quietDir = TARGET_DIR / 'quiet' / source.stem
+	missHit, missWarnings, missFiles = convert(source, missDir / 'out.json', 'DEBUG')
+	_, quietWarnings, quietFiles = convert(source, quietDir / 'out.json', 'WARNING')
+	hitHit, hitWarnings, hitFiles = convert(source, hitDir / 'out.json', 'DEBUG')
+	return (not missHit and hitHit
+		and missWarnings == quietWarnings == hitWarnings
+		and missFiles == quietFiles == hitFiles)
+
+
+class ListHandler(logging.Handler):
+
+	def __init__(self):
+		super().__init__()
+		self.messages = []
+
+	def emit(self, record):
+		self.messages.append(record.getMessage())
+
+
+def replayed(cache, source):
+	handler = ListHandler()
+	logger.addHandler(handler)
+	try:
+		cache.convertFile(source)
+	finally:
+		logger.removeHandler(handler)
+	return [m for m in handler.messages if not m.startswith('Cache ')]
+
+
+def testConcurrentCache(sources):
+	alone = ktxjuggle.Cache(TARGET_DIR / 'alone')
+	shared = ktxjuggle.Cache(TARGET_DIR / 'shared')
+	expected = {source: replayed(alone, source) for source in sources}
+	state = (logger.level, logger.propagate, list(logger.handlers))
+	# Switch threads often, so that the conversions interleave
+	sys.setswitchinterval(1e-6)
+	with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+		list(executor.map(shared.convertFile, sources * 8))
+	isUnchanged = state == (logger.level, logger.propagate, list(logger.handlers))
+	return isUnchanged and all(replayed(shared, s) == expected[s] for s in sources)
+
+
+shutil.rmtree(TARGET_DIR, ignore_errors=True)
+summary = '  OK'
+sources = synthetic.writeSynthetic(TARGET_DIR / 'source')
+for source in sources:
+	if testCache(source):
+		print('  ok ', source)
+	else:
+		print(' fail', source)
+		summary = ' FAIL'
+
+logger = logging.getLogger('ktxjuggle')
+logger.setLevel(logging.DEBUG)
+if testConcurrentCache(sources):
+	print('  ok ', 'concurrent')
+else:
+	print(' fail', 'concurrent')
+	summary = ' FAIL'
+print(summary)
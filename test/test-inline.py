@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Encodes images as inline names and back, and checks
+that oversized runs are rejected before expansion.
+"""
+
+import os
+
+from ktxjuggle import binary
+
+
+IMAGES = {
+	'empty':    b'',
+	'uniform':  b'\0' * 1024,
+	'pattern':  b'\1\2\3\4' * 256,
+	'halves':   b'\0' * 512 + b'\xFF' * 512,
+	'tail':     b'\1\2\3' * 100 + b'\1',
+	'rows':     (b'\0' * 32 + b'\xFF' * 32) * 16,
+	'gradient': bytes(range(8)) * 4 + b'\0' * 32,
+	'random':   os.urandom(1024),
+}
+
+
+def testInlineRoundtrip(image, maxInline):
+	name = binary.bytesToName(image, 'sidecar.bin', None, maxInline)
+	if name == 'sidecar.bin':
+		return True
+	return binary.nameToBytes(len(image), name, None) == image
+
+
+def testOversizedRuns():
+	for name in ('%00*10000000000', '%00*3', '%00%00%00', '%00*0'):
+		try:
+			binary.nameToBytes(4, name, None)
+			return False
+		except ValueError:
+			pass
+	return True
+
+
+summary = '  OK'
+for label, image in IMAGES.items():
+	for maxInline in (0, 1, 4, 16, 64):
+		if testInlineRoundtrip(image, maxInline):
+			print('  ok ', label, maxInline)
+		else:
+			print(' fail', label, maxInline)
+			summary = ' FAIL'
+if testOversizedRuns():
+	print('  ok ', 'oversized runs')
+else:
+	print(' fail', 'oversized runs')
+	summary = ' FAIL'
+print(summary)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Edits the metadata of synthetic .ktx files, in place, through
+a symlink, and into a new file, and compares the result
+against a full conversion with the same metadata.
+"""
+
+import io
+import pathlib
+import shutil
+
+import ktxjuggle
+import synthetic
+from ktxjuggle.ktx import packMetadata
+from ktxjuggle.metadata import applyEdits
+
+
+TARGET_DIR = pathlib.Path('temp/metadata')
+
+EDITS = {
+	'same size': ([(b'KTXorientation', b'S=r,T=u\0')], []),
+	'grow':      ([(b'new', b'value'), (b'foo', b'baz')], []),
+	'shrink':    ([], [b'KTXorientation']),
+}
+
+
+def expectedBytes(source, setPairs, deleteKeys):
+	with open(source, mode='rb') as stream:
+		ktx = ktxjuggle.Ktx.fromBinary(stream)
+	ktx.metadata = applyEdits(ktx.metadata, setPairs, deleteKeys)
+	ktx.bytesOfKeyValueData = len(packMetadata(ktx.metadata))
+	stream = io.BytesIO()
+	ktx.toBinary(stream)
+	return stream.getvalue()
+
+
+def testEdit(source, setPairs, deleteKeys):
+	expected = expectedBytes(source, setPairs, deleteKeys)
+
+	inPlace = TARGET_DIR / ('inplace-' + source.name)
+	shutil.copyfile(source, inPlace)
+	ktxjuggle.editMetadata(inPlace, None, setPairs, deleteKeys)
+
+	linked = TARGET_DIR / ('linked-' + source.name)
+	link = TARGET_DIR / ('link-' + source.name)
+	shutil.copyfile(source, linked)
+	if link.is_symlink():
+		link.unlink()
+	link.symlink_to(linked.name)
+	ktxjuggle.editMetadata(link, None, setPairs, deleteKeys)
+
+	copy = TARGET_DIR / ('copy-' + source.name)
+	ktxjuggle.editMetadata(source, copy, setPairs, deleteKeys)
+
+	return (
+		inPlace.read_bytes() == expected and
+		link.is_symlink() and linked.read_bytes() == expected and
+		copy.read_bytes() == expected and
+		ktxjuggle.readMetadata(copy) == ktxjuggle.Ktx.fromBuffer(expected).metadata)
+
+
+summary = '  OK'
+for source in synthetic.writeSynthetic(TARGET_DIR / 'source'):
+	for label, (setPairs, deleteKeys) in EDITS.items():
+		if testEdit(source, setPairs, deleteKeys):
+			print('  ok ', source, label)
+		else:
+			print(' fail', source, label)
+			summary = ' FAIL'
+print(summary)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
-Converts each .ktx from the data directory to .json and back,
-and compares the resulting .ktx file against the original.
+Converts each .ktx from the data directory to .json and .jsonl
+and back, and compares the resulting .ktx files against the original.
 """
 
 import filecmp
@@ -14,8 +14,9 @@ SOURCE_FILES = pathlib.Path('data').glob('**/*.ktx')
 TARGET_DIR   = pathlib.Path('temp/roundtrip')
 
 
-def testKtxRoundtrip(source, target):
-	json = target.with_suffix('.json')
+def testKtxRoundtrip(source, target, suffix):
+	json = target.with_suffix(suffix)
+	target = target.with_suffix(suffix + '.ktx')
 	subprocess.run([EXECUTABLE, '--log=WARNING', source, json])
 	subprocess.run([EXECUTABLE, '--log=WARNING', json, target])
 	return filecmp.cmp(source, target)
@@ -23,9 +24,10 @@ def testKtxRoundtrip(source, target):
 
 summary = '  OK'
 for source in sorted(SOURCE_FILES):
-	if testKtxRoundtrip(source, TARGET_DIR/source):
-		print('  ok ', source)
-	else:
-		print(' fail', source)
-		summary = ' FAIL'
+	for suffix in ('.json', '.jsonl'):
+		if testKtxRoundtrip(source, TARGET_DIR/source, suffix):
+			print('  ok ', source, suffix)
+		else:
+			print(' fail', source, suffix)
+			summary = ' FAIL'
 print(summary)